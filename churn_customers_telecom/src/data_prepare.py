@@ -1,6 +1,27 @@
+import re
+from functools import lru_cache
 import pandas as pd
+from typing import List, Optional
 
-def snake_columns_rename(data: pd.DataFrame):
+try:
+    from IPython import get_ipython
+    from IPython.display import display
+except ImportError:
+    def get_ipython():
+        return None
+    display = print
+
+_CAMEL = re.compile(r"([a-z0-9])([A-Z])")
+_MULTI = re.compile(r"[ _]+")
+
+@lru_cache(maxsize=None)
+def _to_snake(name: str) -> str:
+    return _MULTI.sub("_", _CAMEL.sub(r"\1_\2", name).lower()).strip("_")
+
+def snake_columns_rename(
+        data: pd.DataFrame,
+        to_categorical: Optional[List[str]] = None,
+        inplace: bool = True):
     '''
     Преобразовываем имена колонок в snake_case.
 
@@ -8,14 +29,19 @@ def snake_columns_rename(data: pd.DataFrame):
     ---------
     data : pandas.DataFrame
         Датасет с признаками.
+    to_categorical : List of str, optional
+        Имена столбцов (уже в snake_case), которые нужно привести к типу category.
+    inplace : bool
+        Переименовать колонки в исходном датасете. Если False, возвращается новый
+        датафрейм с общими с исходным данными (без копирования блоков).
     '''
-    data.columns = (data.columns
-        .str.replace(r"([a-z0-9])([A-Z])", r"\1 \2", regex=True) 
-        .str.replace(" ", "_")                                   
-        .str.lower()                                             
-        .str.replace(r"_+", "_", regex=True)                     
-        .str.strip("_") 
-    )
+    new_cols = [_to_snake(c) for c in data.columns]
+    if inplace:
+        data.columns = new_cols
+    else:
+        data = data.set_axis(new_cols, axis=1, copy=False)
+    for c in (to_categorical or []):
+        data[c] = data[c].astype('category')
     return data
 
 def data_info(data: pd.DataFrame):
@@ -29,8 +55,20 @@ def data_info(data: pd.DataFrame):
     '''
     print('Размер таблицы', data.shape)
     display(data.head(2))
-    data.info()
-    display(data.describe().T)
-    display(data.isna().sum())
-    print('Количество уникальных ID:', len(data['customer_id'].unique()))
-    print('Количество явных дубликатов:', data.duplicated().sum())
\ No newline at end of file
+    if get_ipython() is not None:
+        data.info()
+    else:
+        # вне ноутбука - краткая сводка без форматирования data.info()
+        print(data.dtypes)
+        print('Память, байт:', data.memory_usage().sum())
+    stats = data.describe().T
+    display(stats)
+    # одна редукция по общему bool-массиву вместо суммирования по столбцам
+    na_counts = pd.Series(data.isna().to_numpy().sum(axis=0), index=data.columns)
+    display(na_counts)
+    id_counts = data['customer_id'].value_counts(sort=False, dropna=False)
+    print('Количество уникальных ID:', id_counts.size)
+    # явные дубликаты - полностью совпадающие строки, а не повторы customer_id;
+    # при уникальных ID совпадающих строк быть не может
+    duplicates = 0 if id_counts.size == len(data) else data.duplicated(keep='first').sum()
+    print('Количество явных дубликатов:', duplicates)
\ No newline at end of file
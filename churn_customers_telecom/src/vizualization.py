@@ -1,8 +1,11 @@
+import os
+import sys
+import multiprocessing as mp
 from dataclasses import dataclass
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-from typing import List
+from typing import List, Optional
 
 @dataclass
 class PlotCfg:
@@ -14,7 +17,7 @@ class PlotCfg:
     churn_value: int
         Значение целевой переменной, соответствующей "ушедшим" клиентам.
     nan_label: str
-        Ярлык для пропущенных значений в категориальных переменных. - ???
+        Ярлык для пропущенных значений в категориальных переменных.
     percent_decimals: int
         Кол-во знаков после запятой при выводе процентов.
     '''
@@ -23,6 +26,70 @@ class PlotCfg:
     nan_label: str = 'Nan/Пусто'
     percent_decimals: int = 1
 
+def _save_figure(fig, path: str):
+    fig.savefig(path)
+
+class AsyncPlotter:
+    '''
+    Сохранение графиков в PNG в фоновых процессах (рендеринг в Agg упирается в CPU).
+    В ядре Jupyter (многопоточный процесс) fork может привести к взаимной блокировке,
+    поэтому там графики сохраняются в текущем процессе.
+
+    processes: int
+        Максимальное кол-во одновременно работающих процессов.
+    '''
+    def __init__(self, processes: Optional[int] = None):
+        self.processes = processes or mp.cpu_count()
+        # fork - чтобы не сериализовывать фигуру для дочернего процесса;
+        # на macOS fork после загрузки Cocoa небезопасен, там - spawn
+        self._ctx = (None if 'ipykernel' in sys.modules
+                     else mp.get_context('fork' if sys.platform.startswith('linux') else 'spawn'))
+        self._procs = []
+        self._failed = []
+
+    def _wait(self, proc, path: str):
+        proc.join()
+        if proc.exitcode != 0:
+            self._failed.append(path)
+
+    def save(self, fig, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if self._ctx is None:
+            _save_figure(fig, path)
+            return
+        while len(self._procs) >= self.processes:
+            self._wait(*self._procs.pop(0))
+        if self._failed:
+            self.join()
+        proc = self._ctx.Process(target=_save_figure, args=(fig, path))
+        proc.start()
+        self._procs.append((proc, path))
+
+    def join(self):
+        '''
+        Дожидается всех процессов; если какой-то график не сохранился - RuntimeError.
+        '''
+        for proc, path in self._procs:
+            self._wait(proc, path)
+        self._procs = []
+        if self._failed:
+            failed, self._failed = self._failed, []
+            raise RuntimeError(f'Не удалось сохранить графики: {", ".join(failed)}')
+
+def _finish_figure(
+        fig,
+        plotter: Optional[AsyncPlotter] = None,
+        out_dir: Optional[str] = None,
+        name: Optional[str] = None):
+    '''
+    Выводит график на экран или, если задан plotter, сохраняет его в out_dir/name.
+    '''
+    if plotter is None:
+        plt.show()
+    else:
+        plotter.save(fig, os.path.join(out_dir, name))
+    plt.close(fig)
+
 def category_graph(
         data: pd.DataFrame,
         columns: List[str],
@@ -45,41 +112,43 @@ def category_graph(
     n = len(columns)
     nrows = (n + 1) // 2  
     fig, axes = plt.subplots(nrows, 2, figsize=(12, 4 * nrows))
+    n_rows = len(data)
     
     for idx, column in enumerate(columns):
         row = idx // 2
         col = idx % 2
         ax = axes[row, col] if nrows > 1 else axes[col]
         
-        values = data.value_counts(column)
-        percentages = (values / len(data) * 100).round(cfg.percent_decimals)
+        values = data[column].value_counts(sort=False, dropna=False)
+        values.index = values.index.astype(object).fillna(cfg.nan_label)
+        percentages = (values / n_rows * 100).round(cfg.percent_decimals)
 
         # --- выбор типа графика
-        if len(data[column].unique()) <= 2:
+        if values.size <= 2:
             # Круговая диаграмма
-            ax.pie(values.values, 
-                   autopct=lambda x: f'{x:.{cfg.percent_decimals}f}%\n({int(round(x* sum(values) / 100))})',
-                   startangle=90,
-                   labels=values.index)
+            total = values.sum()
+            labels = [f'{name}\n{cnt} ({cnt / total * 100:.{cfg.percent_decimals}f}%)'
+                      for name, cnt in zip(values.index, values.values)]
+            ax.pie(values.values, startangle=90, labels=labels)
             ax.set_title(f'Соотношение значений в поле "{column}"')
             
         else:
             # Вертикальная столбчатая диаграмма
-            ax.bar(range(len(values)), values.values)
-            ax.set_xticks(range(len(values)))
-            ax.set_xticklabels(values.index, rotation=45, ha='right')
-            ax.set_title(f'Распределение в поле "{column}"')
-            ax.set_ylabel('Количество абонентов')
+            xs = np.arange(values.size)
+            bars = ax.bar(xs, values.values)
 
             # Увеличиваем верхний предел для корректного отображения подписей
-            max_value = max(values.values)
-            ax.set_ylim(0, max_value * 1.2)  
+            max_value = values.max()
+            ax.set(xticks=xs,
+                   xticklabels=[str(v) for v in values.index],
+                   title=f'Распределение в поле "{column}"',
+                   ylabel='Количество абонентов',
+                   ylim=(0, max_value * 1.2))
+            plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
 
             # Добавляем подписи
-            for i, (count, pct) in enumerate(zip(values.values, percentages)):
-                ax.text(i, count + max_value * 0.02,
-                        f'{count}\n({pct}%)', 
-                        va='bottom', ha='center', fontsize=9)
+            ax.bar_label(bars, padding=3, fontsize=9,
+                         labels=[f'{c}\n({p}%)' for c, p in zip(values.values, percentages.values)])
     
     # Удаляем лишние ячейки сетки
     if n % 2 != 0:
@@ -94,7 +163,8 @@ def category_graph(
 def numeric_graph(
         data: pd.DataFrame,
         num_cols: List[str],
-        cfg: PlotCfg = PlotCfg()):
+        cfg: PlotCfg = PlotCfg(),
+        out_dir: Optional[str] = None):
     '''
     Функция для вывода гистограммы и ящика с усами для количественных переменных.
 
@@ -104,23 +174,50 @@ def numeric_graph(
         Датасет с признаками.
     num_cols : List of str
         Имена количественных столбцов для отрисовки.
+    out_dir : str, optional
+        Папка для PNG-файлов; если задана, графики сохраняются, а не выводятся на экран.
     '''
-    for column in num_cols:
-        data[column].hist(bins=30)
-        plt.title(f'Гистограмма распределения в поле "{column}"')
-        plt.xlabel('Значение')
-        plt.ylabel('Количество абонентов')
-        plt.show()   
-
-        data[column].plot(kind='box')
-        plt.title(f'Разброс значений признаков в поле "{column}"')
-        plt.grid(True)
-        plt.show()
+    # повторы имен дали бы в data[num_cols] дублирующиеся столбцы
+    num_cols = list(dict.fromkeys(num_cols))
+    if not num_cols:
+        return
+
+    # hist и box молча пропускают нечисловые столбцы - тогда подписи осей
+    # разъедутся с num_cols, поэтому проверяем заранее
+    bad_cols = [c for c in num_cols
+                if not pd.api.types.is_numeric_dtype(data[c]) or pd.api.types.is_bool_dtype(data[c])]
+    if bad_cols:
+        raise ValueError(f'Нечисловые столбцы в num_cols: {bad_cols}')
+
+    plotter = AsyncPlotter() if out_dir is not None else None
+
+    # --- подготовка сетки для компактного отображения
+    nrows = (len(num_cols) + 1) // 2
+    figsize = (12, 4 * nrows)
+
+    axes = data[num_cols].hist(bins=30, figsize=figsize, layout=(nrows, 2))
+    for ax, column in zip(np.ravel(axes), num_cols):
+        ax.set_title(f'Гистограмма распределения в поле "{column}"')
+        ax.set_xlabel('Значение')
+        ax.set_ylabel('Количество абонентов')
+    plt.tight_layout()
+    _finish_figure(np.ravel(axes)[0].figure, plotter, out_dir, 'numeric_hist.png')
+
+    axes = data[num_cols].plot(kind='box', subplots=True, layout=(nrows, 2), figsize=figsize)
+    for ax, column in zip(np.ravel(axes), num_cols):
+        ax.set_title(f'Разброс значений признаков в поле "{column}"')
+        ax.grid(True)
+    plt.tight_layout()
+    _finish_figure(np.ravel(axes)[0].figure, plotter, out_dir, 'numeric_box.png')
+
+    if plotter is not None:
+        plotter.join()
 
 def category_graph_compare(
         data: pd.DataFrame,
         cat_columns: List[str],
-        cfg: PlotCfg = PlotCfg()):
+        cfg: PlotCfg = PlotCfg(),
+        out_dir: Optional[str] = None):
     
     '''
     Сравнивает распределения категорий между группами в процентах (ушедшие/оставшиеся).
@@ -131,21 +228,29 @@ def category_graph_compare(
         Датасет с признаками.
     columns : List of str
         Имена категориальных столбцов для отрисовки.
+    out_dir : str, optional
+        Папка для PNG-файлов; если задана, графики сохраняются, а не выводятся на экран.
     '''
+    plotter = AsyncPlotter() if out_dir is not None else None
 
-    churned_data = data.query(f'{cfg.target_col} == @cfg.churn_value')
-    retained_data = data.query(f'{cfg.target_col} != @cfg.churn_value')
+    target = data[cfg.target_col]
+    mask = (target == cfg.churn_value).to_numpy(dtype=bool, na_value=False)
+    # размеры групп - по строкам с известным таргетом (crosstab их же и считает),
+    # включая пропуски в самом признаке
+    churned_total = mask.sum()
+    totals = np.array([churned_total, target.notna().sum() - churned_total])
 
     for column in cat_columns:
         # --- считаем % по категориям
-        churned_counts = churned_data[column].value_counts()
-        churned_total = len(churned_data)
-        
-        retained_counts = retained_data[column].value_counts()
-        retained_total = len(retained_data)
-        
-        churned_pct = (churned_counts / churned_total * 100).round(cfg.percent_decimals)
-        retained_pct = (retained_counts / retained_total * 100).round(cfg.percent_decimals)
+        # одна таблица сопряженности, индексы категорий выровнены между группами
+        ct = pd.crosstab(data[column], data[cfg.target_col])
+        # ушедших может не быть совсем - тогда рисуем пустые столбцы
+        ct = ct.reindex(columns=ct.columns.union([cfg.churn_value]), fill_value=0)
+        counts = pd.DataFrame({'churned': ct[cfg.churn_value],
+                               'retained': ct.drop(columns=cfg.churn_value).sum(axis=1)})
+        pct = (counts / np.maximum(totals, 1) * 100).round(cfg.percent_decimals)
+        churned_counts, retained_counts = counts['churned'], counts['retained']
+        churned_pct, retained_pct = pct['churned'], pct['retained']
 
         fig, ax = plt.subplots(figsize=(10, 6))
         x_pos = np.arange(len(churned_pct))
@@ -160,14 +265,11 @@ def category_graph_compare(
         ax.set_ylim(0, 105)  
 
         # --- формирование подписей над колонками
-        for i, (bar1, bar2) in enumerate(zip(bars1, bars2)):
-            ax.text(bar1.get_x() + bar1.get_width()/2., bar1.get_x() + 1,  
-                   f'{bar1.get_height():.{cfg.percent_decimals}f}%\n({churned_counts.iloc[i]})', 
-                   ha='center', va='bottom', fontsize=8)
-
-            ax.text(bar2.get_x() + bar2.get_width()/2., bar2.get_x() + 1,  
-                   f'{bar2.get_height():.{cfg.percent_decimals}f}%\n({retained_counts.iloc[i]})', 
-                   ha='center', va='bottom', fontsize=8)
+        d = cfg.percent_decimals
+        ax.bar_label(bars1, padding=3, fontsize=8,
+                     labels=[f'{h:.{d}f}%\n({c})' for h, c in zip(churned_pct.values, churned_counts.values)])
+        ax.bar_label(bars2, padding=3, fontsize=8,
+                     labels=[f'{h:.{d}f}%\n({c})' for h, c in zip(retained_pct.values, retained_counts.values)])
         
         ax.set_xlabel('Значение')
         ax.set_ylabel('Доля, %')
@@ -178,12 +280,16 @@ def category_graph_compare(
         ax.grid(True, alpha=0.3)
         
         plt.tight_layout()
-        plt.show()
+        _finish_figure(fig, plotter, out_dir, f'{column}.png')
+
+    if plotter is not None:
+        plotter.join()
 
 def numeric_graph_compare(
         data: pd.DataFrame,
         num_cols: List[str],
-        cfg: PlotCfg = PlotCfg()):
+        cfg: PlotCfg = PlotCfg(),
+        out_dir: Optional[str] = None):
     '''
     Сравнивает гистограммы для числовых признаков (ушедшие/оставшиеся).
 
@@ -193,32 +299,33 @@ def numeric_graph_compare(
         Датасет с признаками.
     num_cols : List of str
         Имена количественных столбцов для отрисовки.
+    out_dir : str, optional
+        Папка для PNG-файлов; если задана, графики сохраняются, а не выводятся на экран.
     '''
-    churned_data = data.query(f'{cfg.target_col} == @cfg.churn_value')
-    retained_data = data.query(f'{cfg.target_col} != @cfg.churn_value')
+    plotter = AsyncPlotter() if out_dir is not None else None
+
+    target = data[cfg.target_col]
+    mask = (target == cfg.churn_value).to_numpy(dtype=bool, na_value=False)
+    # строки без таргета не попадают ни в одну группу (как в category_graph_compare)
+    retained = target.notna().to_numpy() & ~mask
 
     for column in num_cols:
-        ax = churned_data.plot(kind='hist', 
-                       y=column, 
-                       histtype='step',
-                       linewidth=5, 
-                       alpha=0.7, 
-                       label='Ушедшие абоненты',
-                       density=True 
-                      )
-
-        retained_data.plot(kind='hist', 
-                  y=column, 
-                  histtype='step',
-                  linewidth=5, 
-                  alpha=0.7, 
-                  label='Оставшиеся абоненты',
-                  ax=ax, 
-                  grid=True, 
-                  legend=True,
-                  density=True 
-                )
-        plt.title(f'Распределение доли среди ушедших и оставшихся абонентов в поле {column}')
-        plt.xlabel(f'{column}')
-        plt.ylabel('Количество абонентов')
-        plt.show()
\ No newline at end of file
+        # общие границы корзин для обеих групп - гистограммы сопоставимы
+        values = data[column].to_numpy(dtype=float, na_value=np.nan)
+        valid = ~np.isnan(values)
+        edges = np.histogram_bin_edges(values[valid], bins=30)
+        h_churned, _ = np.histogram(values[mask & valid], bins=edges, density=True)
+        h_retained, _ = np.histogram(values[retained & valid], bins=edges, density=True)
+
+        fig, ax = plt.subplots()
+        ax.stairs(h_churned, edges, linewidth=5, alpha=0.7, label='Ушедшие абоненты')
+        ax.stairs(h_retained, edges, linewidth=5, alpha=0.7, label='Оставшиеся абоненты')
+        ax.set_title(f'Распределение доли среди ушедших и оставшихся абонентов в поле {column}')
+        ax.set_xlabel(f'{column}')
+        ax.set_ylabel('Количество абонентов')
+        ax.grid(True)
+        ax.legend()
+        _finish_figure(fig, plotter, out_dir, f'{column}.png')
+
+    if plotter is not None:
+        plotter.join()